@@ -1,10 +1,30 @@
 import time
+from functools import partial
 import numpy as np
 import pandas as pd
 from scipy.integrate import solve_ivp
-from scipy.interpolate import interp1d
+from numba import njit, prange
 import gymnasium as gym
 from pettingzoo import ParallelEnv
+from stable_baselines3.common.vec_env import VecEnv
+
+
+HISTORY_COLUMNS = ['time', 'drum_1', 'drum_2', 'drum_3', 'drum_4',
+                   'drum_5', 'drum_6', 'drum_7', 'drum_8', 'measured_power',
+                   'desired_power', 'actual_power', 'c1', 'c2', 'c3',
+                   'c4', 'c5', 'c6', 'Tf', 'Tm', 'Tc', 'Xe', 'I']
+
+# reward and termination rules shared by HolosMulti and BatchedHolosVecEnv
+POWER_BAND = 5  # percent of full power, training episodes end when further from the desired power
+MAX_POWER = 1.1  # 110% power is way too much
+TERMINATION_PENALTY = 100
+
+
+def interp_profile(times, powers):
+    """Create a piecewise linear lookup from breakpoints"""
+    xp = np.asarray(times, dtype=np.float64)
+    fp = np.asarray(powers, dtype=np.float64)
+    return partial(np.interp, xp=xp, fp=fp)
 
 
 class HolosPK:
@@ -86,7 +106,7 @@ class HolosPK:
         drum_forcers = []
         for i, drum_angle in enumerate(drum_angles):
             new_angle = np.clip(drum_angle + drum_action[i], 0, 180).item()  # can't go beyond limits
-            drum_forcers.append(interp1d([0, time], [drum_angle, new_angle]))
+            drum_forcers.append(interp_profile([0, time], [drum_angle, new_angle]))
 
         assert len(drum_forcers) == len(drum_angles)
         return drum_forcers
@@ -129,6 +149,84 @@ class HolosPK:
 
         return [d_n_r, d_c1, d_c2, d_c3, d_c4, d_c5, d_c6, d_Tf, d_Tm, d_Tc, d_Xe, d_I]
 
+    def kernel_params(self):
+        """Pack the scalar parameters in the order expected by _reactor_rhs"""
+        return np.array([self.rho_max, self.rho_ss, self.beta, self.neutron_lifetime,
+                         self.alpha_f, self.alpha_m, self.Tf0, self.Tm0,
+                         self.sigma_Xe, self.Sigma_f, self.Xe0,
+                         self.heat_f, self.P_r, self.K_fm, self.K_mc,
+                         self.M_f, self.cp_f, self.M_m, self.cp_m, self.M_c, self.cp_c,
+                         self.M_dot, self.T_in, self.therm_n_vel, self.n_0,
+                         self.yield_I, self.yield_Xe, self.lambda_I, self.lambda_Xe],
+                        dtype=np.float64)
+
+
+@njit(cache=True)
+def _reactor_rhs(y, drum_angles, p, betas, lambdas, dy):
+    """Compiled version of HolosPK.reactor_dae for fixed drum angles, written into dy"""
+    rho_max, rho_ss, beta, neutron_lifetime = p[0], p[1], p[2], p[3]
+    alpha_f, alpha_m, Tf0, Tm0 = p[4], p[5], p[6], p[7]
+    sigma_Xe, Sigma_f, Xe0 = p[8], p[9], p[10]
+    heat_f, P_r, K_fm, K_mc = p[11], p[12], p[13], p[14]
+    M_f, cp_f, M_m, cp_m, M_c, cp_c = p[15], p[16], p[17], p[18], p[19], p[20]
+    M_dot, T_in, therm_n_vel, n_0 = p[21], p[22], p[23], p[24]
+    yield_I, yield_Xe, lambda_I, lambda_Xe = p[25], p[26], p[27], p[28]
+    n_r, Tf, Tm, Tc, Xe, I = y[0], y[7], y[8], y[9], y[10], y[11]
+
+    drum_reactivity = 0.0
+    for angle in drum_angles:
+        drum_reactivity += rho_max * (1 - np.cos(np.deg2rad(angle))) / 2 - rho_ss
+    rho = (drum_reactivity
+           + alpha_f * (Tf - Tf0)
+           + alpha_m * (Tm - Tm0)
+           - sigma_Xe * (Xe - Xe0) / Sigma_f)
+
+    # Kinetics equations with six-delayed neutron groups
+    delayed = 0.0
+    for k in range(6):
+        delayed += betas[k] * y[1 + k]
+        dy[1 + k] = lambdas[k] * n_r - lambdas[k] * y[1 + k]
+    dy[0] = ((rho - beta) * n_r + delayed) / neutron_lifetime
+
+    # Thermal–hydraulics model of the reactor core
+    dy[7] = (heat_f * P_r * n_r - K_fm * (Tf - Tc)) / (M_f * cp_f)
+    dy[8] = (((1 - heat_f) * P_r * n_r
+              + K_fm * (Tf - Tm)
+              - K_mc * (Tm - Tc))
+             / (M_m * cp_m))
+    dy[9] = (K_mc * (Tm - Tc) - 2*M_dot * cp_c * (Tc - T_in)) / (M_c * cp_c)
+
+    # Xenon and Iodine dynamics
+    n_rate_density = therm_n_vel * n_0 * n_r
+    dy[10] = (yield_Xe * Sigma_f * n_rate_density
+              + lambda_I * I
+              - lambda_Xe * Xe
+              - sigma_Xe * Xe * n_rate_density)
+    dy[11] = yield_I * Sigma_f * n_rate_density - lambda_I * I
+
+
+@njit(parallel=True, cache=True)
+def _holos_step_batch(states, drum_angles, drum_actions, p, betas, lambdas, n_substeps, out_states):
+    """Advance a batch of reactors one second with fixed-step RK4, drums moving linearly to their new angle"""
+    n_envs, n_states = states.shape
+    dt = 1.0 / n_substeps
+    for i in prange(n_envs):
+        y = states[i].copy()
+        start = drum_angles[i]
+        travel = np.minimum(np.maximum(start + drum_actions[i], 0.0), 180.0) - start
+        k1 = np.empty(n_states)
+        k2 = np.empty(n_states)
+        k3 = np.empty(n_states)
+        k4 = np.empty(n_states)
+        for step in range(n_substeps):
+            t = step * dt
+            _reactor_rhs(y, start + travel * t, p, betas, lambdas, k1)
+            _reactor_rhs(y + 0.5 * dt * k1, start + travel * (t + 0.5 * dt), p, betas, lambdas, k2)
+            _reactor_rhs(y + 0.5 * dt * k2, start + travel * (t + 0.5 * dt), p, betas, lambdas, k3)
+            _reactor_rhs(y + dt * k3, start + travel * (t + dt), p, betas, lambdas, k4)
+            y += dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+        out_states[i] = y
+
 
 class HolosMulti(gym.Env):
     def __init__(self, profile, episode_length, run_path=None,
@@ -136,6 +234,8 @@ class HolosMulti(gym.Env):
                  valid_maskings=(0,), symmetry_reward=False):
         self.profile = profile
         self.episode_length = episode_length
+        # evaluate the whole profile up front so steps only need an index lookup
+        self.desired_profile = np.interp(np.arange(episode_length + 2, dtype=np.float64), *profile)
         self.run_path = run_path
         self.train_mode = train_mode
         self.noise = noise
@@ -156,7 +256,7 @@ class HolosMulti(gym.Env):
 
     def reset(self, seed=None, options=None):
         super(self.__class__, self).reset(seed=seed)
-        current_desired_power = self.profile(0) / 100
+        current_desired_power = self.desired_profile[0] / 100
         assert current_desired_power == 1, 'current code assumes start at full power steady state'
         self.time = 0
         self.drum_angles = np.array([77.8]*8)
@@ -170,18 +270,20 @@ class HolosMulti(gym.Env):
         self.masks[mask_indices] = 0
         assert np.sum(self.masks) == 8 - num_masks, 'error in mask assignment'
 
-        next_desired_power = self.profile(self.time + 1)
+        next_desired_power = self.desired_profile[self.time + 1]
         fuzz = np.random.normal(0, self.noise)
         fuzzed = current_power + fuzz
-        self.history = [[self.time, *self.drum_angles, fuzzed, current_desired_power, *self.y]]
+        # one row per timestep, filled in by index as the episode runs
+        self.history = np.empty((self.episode_length + 1, len(HISTORY_COLUMNS)))
+        latest = self.record_history(fuzzed, current_desired_power)
         observation = {
-            "drum_angles": self.drum_angles / 180,  # convert to 0 to 1 box space
-            "power": np.array([fuzzed]),
-            "last_power": np.array([fuzzed]),
-            "next_desired_power": np.array([next_desired_power / 100]),
+            "drum_angles": (self.drum_angles / 180).astype(np.float32),  # convert to 0 to 1 box space
+            "power": np.array([fuzzed], dtype=np.float32),
+            "last_power": np.array([fuzzed], dtype=np.float32),
+            "next_desired_power": np.array([next_desired_power / 100], dtype=np.float32),
         }
 
-        return observation, {'latest': self.history[-1]}
+        return observation, {'latest': latest}
 
     def gym2real_action(self, gym_action):
         """Convert from the -1 to 1 box space to -0.5 to 0.5"""
@@ -204,25 +306,24 @@ class HolosMulti(gym.Env):
         self.y = sol.y[:,-1]
         self.drum_angles += real_action
         self.drum_angles = np.clip(self.drum_angles, 0, 180)
-        current_desired_power = self.profile(self.time) / 100
+        current_desired_power = self.desired_profile[self.time] / 100
         self.time += 1
 
         current_power, *_ = self.y
         assert current_power >= 0 and current_power <= 2, 'power out of reasonable bounds'
-        next_desired_power = self.profile(self.time + 1)
+        next_desired_power = self.desired_profile[self.time + 1]
         fuzz = np.random.normal(0, self.noise)
         fuzzed = current_power + fuzz
-        self.history.append([self.time, *self.drum_angles, fuzzed, current_desired_power, *self.y])
-        assert len(self.history) == self.time + 1, 'history length mismatch'
+        latest = self.record_history(fuzzed, current_desired_power)
         observation = {
-            "drum_angles": self.drum_angles / 180,  # convert to 0-1 box space
-            "power": np.array([fuzzed]),
-            "last_power": np.array([self.history[-2][9]]),  # 9 is the measured power index
-            "next_desired_power": np.array([next_desired_power / 100]),  # convert to 0-1 box space
+            "drum_angles": (self.drum_angles / 180).astype(np.float32),  # convert to 0-1 box space
+            "power": np.array([fuzzed], dtype=np.float32),
+            "last_power": np.array([self.history[self.time - 1, 9]], dtype=np.float32),  # 9 is the measured power index
+            "next_desired_power": np.array([next_desired_power / 100], dtype=np.float32),  # convert to 0-1 box space
         }
 
         reward, terminated = self.calc_reward(current_power, current_desired_power)
-        if current_power > 1.1:  # 110% power is way too much
+        if current_power > MAX_POWER:
             terminated = True
         if self.symmetry_reward:
             reward -= abs(np.max(real_action) - np.min(real_action))
@@ -230,10 +331,20 @@ class HolosMulti(gym.Env):
         truncated = False
         if self.time >= self.episode_length - 1:
             truncated = True
-        info = {'latest': self.history[-1]}
+        info = {'latest': latest}
 
         return observation, reward, terminated, truncated, info
 
+    def record_history(self, measured_power, desired_power):
+        """Fill the history row for the current timestep and return it"""
+        row = self.history[self.time]
+        row[0] = self.time
+        row[1:9] = self.drum_angles
+        row[9] = measured_power
+        row[10] = desired_power
+        row[11:] = self.y
+        return row
+
     def calc_reward(self, current_power, desired_power):
         """Returns reward and whether the episode is terminated."""
         # First component: give reward to stay in the correct range
@@ -244,31 +355,27 @@ class HolosMulti(gym.Env):
         # give a punish outside bounds if in train mode
         terminated = False
         if (self.train_mode and
-            (diff > 5
+            (diff > POWER_BAND
             or self.drum_angles.min() <= 0
             or self.drum_angles.max() >= 180)):
-            reward -= 100
+            reward -= TERMINATION_PENALTY
             terminated = True
 
         return reward, terminated
 
-    def render(self, mode='human'):
-        run_history = np.array(self.history)
-        column_names = ['time', 'drum_1', 'drum_2', 'drum_3', 'drum_4',
-                        'drum_5', 'drum_6', 'drum_7', 'drum_8', 'measured_power',
-                        'desired_power', 'actual_power', 'c1', 'c2', 'c3',
-                        'c4', 'c5', 'c6', 'Tf', 'Tm', 'Tc', 'Xe', 'I']
-        df = pd.DataFrame(run_history, columns=column_names)
+    def render(self, mode='human', save_csv=False):
+        """Return the run history, optionally archiving it as a csv in run_path"""
+        df = pd.DataFrame(self.history[:self.time + 1], columns=HISTORY_COLUMNS)
         df['diff'] = (df['actual_power'] - df['desired_power']) * 100
         assert df['actual_power'][0] == 1, 'steady state initial power value should be 100'
         assert df['drum_1'][0] == 77.8, 'steady state initial drum angle should be 77.8'
-        self.history = df
 
-        if self.run_path is not None:
-            assert self.run_path.is_dir(), 'run_path must be a valid directory'
+        if save_csv:
+            assert self.run_path is not None and self.run_path.is_dir(), 'run_path must be a valid directory'
             timestr = time.strftime("%Y%m%d-%H%M%S")
             save_path = self.run_path / f'run_history_{timestr}.csv'
             df.to_csv(save_path, index=False)
+        return df
 
 
 class HolosSingle(gym.Env):
@@ -277,6 +384,7 @@ class HolosSingle(gym.Env):
                  valid_maskings=(0,)):
         self.profile = profile
         self.multi_env = HolosMulti(profile, episode_length, run_path, train_mode, noise, debug, valid_maskings)
+        self.desired_profile = self.multi_env.desired_profile
         self.action_space = gym.spaces.Box(low=-1, high=1, shape=(1,), dtype=np.float32)
         self.observation_space = gym.spaces.Dict({
             "drum_angle": gym.spaces.Box(low=0, high=1, shape=(1,), dtype=np.float32),
@@ -291,7 +399,7 @@ class HolosSingle(gym.Env):
         self.time = self.multi_env.time
         observation = obs.copy()
         observation.pop('drum_angles', None)
-        observation["drum_angle"] = np.array([np.mean(obs["drum_angles"])])  # treat as a single drum angle
+        observation["drum_angle"] = np.array([np.mean(obs["drum_angles"])], dtype=np.float32)  # treat as a single drum angle
         return observation, info
 
     def step(self, action):
@@ -301,11 +409,11 @@ class HolosSingle(gym.Env):
         self.time = self.multi_env.time
         observation = obs.copy()
         observation.pop('drum_angles', None)
-        observation["drum_angle"] = np.array([np.mean(obs["drum_angles"])])  # treat as a single drum angle
+        observation["drum_angle"] = np.array([np.mean(obs["drum_angles"])], dtype=np.float32)  # treat as a single drum angle
         return observation, reward, terminated, truncated, info
 
-    def render(self, mode='human'):
-        self.multi_env.render(mode=mode)
+    def render(self, mode='human', save_csv=False):
+        return self.multi_env.render(mode=mode, save_csv=save_csv)
 
 
 class HolosMARL(ParallelEnv):
@@ -350,7 +458,7 @@ class HolosMARL(ParallelEnv):
         for agent in self.agents:
             observations[agent].pop('drum_angles', None)
             index = int(agent.split("_")[-1])
-            observations[agent]["drum_angle"] = np.array([obs["drum_angles"][index]])
+            observations[agent]["drum_angle"] = np.array([obs["drum_angles"][index]], dtype=np.float32)
         infos = {agent: info for agent in self.agents}
 
         return observations, infos
@@ -367,7 +475,7 @@ class HolosMARL(ParallelEnv):
         for agent in self.agents:
             observations[agent].pop('drum_angles', None)
             index = int(agent.split("_")[-1])
-            observations[agent]["drum_angle"] = np.array([obs["drum_angles"][index]])
+            observations[agent]["drum_angle"] = np.array([obs["drum_angles"][index]], dtype=np.float32)
         rewards = {agent: (reward) for agent in self.agents}
         terminations = {agent: terminated for agent in self.agents}
         truncations = {agent: truncated for agent in self.agents}
@@ -375,8 +483,182 @@ class HolosMARL(ParallelEnv):
 
         return observations, rewards, terminations, truncations, infos
 
-    def render(self):
-        return self.gym_env.render()
+    def render(self, save_csv=False):
+        return self.gym_env.render(save_csv=save_csv)
 
     def close(self):
         self.gym_env.close()
+
+
+class BatchedHolosVecEnv(VecEnv):
+    """
+    HolosMulti (or HolosSingle with single_action=True) training envs stepped as one batch.
+    The point kinetics of every env are advanced together by a compiled kernel with
+    fixed-step RK4 instead of solve_ivp, and no run history is kept.
+    """
+    def __init__(self, n_envs, profile, episode_length, run_path=None,
+                 train_mode=True, noise=0.0, debug=False,
+                 valid_maskings=(0,), symmetry_reward=False,
+                 single_action=False, n_substeps=10):
+        self.episode_length = episode_length
+        self.desired_profile = np.interp(np.arange(episode_length + 2, dtype=np.float64), *profile)
+        self.train_mode = train_mode
+        self.noise = noise
+        self.valid_maskings = valid_maskings
+        self.symmetry_reward = symmetry_reward
+        self.single_action = single_action
+        self.n_substeps = n_substeps
+        self.render_mode = None
+        self.rng = np.random.default_rng()
+
+        self.pke = HolosPK()
+        self.kernel_params = self.pke.kernel_params()
+        self.angle_key = 'drum_angle' if single_action else 'drum_angles'
+        n_actions = 1 if single_action else 8
+        action_space = gym.spaces.Box(low=-1, high=1, shape=(n_actions,), dtype=np.float32)
+        observation_space = gym.spaces.Dict({
+            self.angle_key: gym.spaces.Box(low=0, high=1, shape=(n_actions,), dtype=np.float32),
+            "power": gym.spaces.Box(low=0, high=1, shape=(1,), dtype=np.float32),
+            "last_power": gym.spaces.Box(low=0, high=1, shape=(1,), dtype=np.float32),
+            "next_desired_power": gym.spaces.Box(low=0, high=1, shape=(1,), dtype=np.float32),
+        })
+
+        self.times = np.zeros(n_envs, dtype=np.int64)
+        self.states = np.empty((n_envs, 12))
+        self.drum_angles = np.empty((n_envs, 8))
+        self.masks = np.ones((n_envs, 8))
+        self.measured_powers = np.empty(n_envs)
+        self.last_powers = np.empty(n_envs)
+        self.actions = None
+        super().__init__(n_envs, observation_space, action_space)
+
+    def _reset_envs(self, indices):
+        self.times[indices] = 0
+        self.states[indices] = self.pke.get_initial_conditions()
+        self.drum_angles[indices] = 77.8
+        self.masks[indices] = 1
+        for i in indices:
+            num_masks = self.rng.choice(self.valid_maskings)
+            self.masks[i, self.rng.choice(8, size=num_masks, replace=False)] = 0
+        fuzzed = self.states[indices, 0] + self.rng.normal(0, self.noise, size=len(indices))
+        self.measured_powers[indices] = fuzzed
+        self.last_powers[indices] = fuzzed
+
+    def _get_obs(self):
+        drum_angles = self.drum_angles / 180  # convert to 0-1 box space
+        if self.single_action:
+            drum_angles = drum_angles.mean(axis=1, keepdims=True)  # treat as a single drum angle
+        next_desired_powers = self.desired_profile[self.times + 1] / 100
+        return {
+            self.angle_key: drum_angles.astype(np.float32),
+            "power": self.measured_powers[:, None].astype(np.float32),
+            "last_power": self.last_powers[:, None].astype(np.float32),
+            "next_desired_power": next_desired_powers[:, None].astype(np.float32),
+        }
+
+    def reset(self):
+        if self._seeds[0] is not None:
+            self.rng = np.random.default_rng(self._seeds[0])
+        self._reset_seeds()
+        self._reset_options()
+        self._reset_envs(np.arange(self.num_envs))
+        return self._get_obs()
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions).reshape(self.num_envs, -1)
+
+    def step_wait(self):
+        real_actions = np.broadcast_to(self.actions, (self.num_envs, 8)) / 2 * self.masks
+        new_states = np.empty_like(self.states)
+        _holos_step_batch(self.states, self.drum_angles, real_actions, self.kernel_params,
+                          self.pke.betas, self.pke.lambdas, self.n_substeps, new_states)
+        self.states = new_states
+        self.drum_angles = np.clip(self.drum_angles + real_actions, 0, 180)
+        current_desired_powers = self.desired_profile[self.times] / 100
+        self.times += 1
+
+        current_powers = self.states[:, 0]
+        assert np.all((current_powers >= 0) & (current_powers <= 2)), 'power out of reasonable bounds'
+        self.last_powers = self.measured_powers
+        self.measured_powers = current_powers + self.rng.normal(0, self.noise, size=self.num_envs)
+
+        # same reward and termination rules as HolosMulti.step
+        diffs = 100 * np.abs(current_powers - current_desired_powers)
+        rewards = 2 - diffs
+        terminated = np.zeros(self.num_envs, dtype=bool)
+        if self.train_mode:
+            terminated = ((diffs > POWER_BAND)
+                          | (self.drum_angles.min(axis=1) <= 0)
+                          | (self.drum_angles.max(axis=1) >= 180))
+            rewards[terminated] -= TERMINATION_PENALTY
+        terminated |= current_powers > MAX_POWER
+        if self.symmetry_reward:
+            rewards -= np.abs(real_actions.max(axis=1) - real_actions.min(axis=1))
+        truncated = self.times >= self.episode_length - 1
+        dones = terminated | truncated
+
+        observations = self._get_obs()
+        infos = [{} for _ in range(self.num_envs)]
+        done_indices = np.flatnonzero(dones)
+        for i in done_indices:
+            infos[i]['terminal_observation'] = {key: value[i] for key, value in observations.items()}
+            infos[i]['TimeLimit.truncated'] = bool(truncated[i] and not terminated[i])
+        if len(done_indices) > 0:
+            self._reset_envs(done_indices)
+            observations = self._get_obs()
+
+        return observations, rewards.astype(np.float32), dones, infos
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name)] * len(self._get_indices(indices))
+
+    def _check_full_batch(self, indices):
+        """Attributes are shared by the whole batch, so they can't be changed for a subset of envs"""
+        if sorted(self._get_indices(indices)) != list(range(self.num_envs)):
+            raise ValueError(f'BatchedHolosVecEnv attributes are shared by all {self.num_envs} envs, '
+                             f'got indices {indices}')
+
+    def set_attr(self, attr_name, value, indices=None):
+        self._check_full_batch(indices)
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        self._check_full_batch(indices)
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        return [result] * self.num_envs
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False] * len(self._get_indices(indices))
+
+
+def compare_rk4_to_solve_ivp(episode_length=200, n_substeps=10, seed=0):
+    """Run one episode of random drum moves through both HolosMulti's solve_ivp step and the
+    batched RK4 kernel, and return the largest relative difference in each state variable"""
+    rng = np.random.default_rng(seed)
+    profile = (np.array([0, episode_length + 1]), np.array([100, 100]))
+    env = HolosMulti(profile, episode_length, train_mode=False)
+    env.reset()
+    pke = env.pke
+    kernel_params = pke.kernel_params()
+    states = np.array([env.y], dtype=np.float64)
+    drum_angles = np.array([env.drum_angles], dtype=np.float64)
+    new_states = np.empty_like(states)
+    max_rel_diff = np.zeros(states.shape[1])
+    for _ in range(episode_length - 1):
+        action = rng.uniform(-1, 1, size=8).astype(np.float32)
+        real_action = env.gym2real_action(action) * env.masks
+        _holos_step_batch(states, drum_angles, real_action[None, :], kernel_params,
+                          pke.betas, pke.lambdas, n_substeps, new_states)
+        states[:] = new_states
+        drum_angles = np.clip(drum_angles + real_action, 0, 180)
+        env.step(action)
+        max_rel_diff = np.maximum(max_rel_diff, np.abs(states[0] - env.y) / np.abs(env.y))
+    return dict(zip(HISTORY_COLUMNS[11:], max_rel_diff))
+
+
+if __name__ == '__main__':
+    for name, diff in compare_rk4_to_solve_ivp().items():
+        print(f'{name}: {diff:.2e}')
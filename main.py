@@ -2,7 +2,8 @@ import argparse
 from pathlib import Path
 import numpy as np
 import pandas as pd
-from scipy.interpolate import interp1d
+import matplotlib
+matplotlib.use('Agg')  # figures are only ever saved to file
 import matplotlib.pyplot as plt
 
 import envs
@@ -10,16 +11,22 @@ import microutils
 plt.style.use('tableau-colorblind10')
 
 
+def save_figure(fig, path):
+    """Save a finished figure with light PNG compression and release it"""
+    fig.savefig(path, pil_kwargs={'compress_level': 1})
+    plt.close(fig)
+
+
 def main(args):
-    # create interpolated power profiles
-    training_profile = interp1d([  0,  10, 20, 30, 50, 70, 120, 140, 160, 195, 200], # times (s)
-                                [100, 100, 98, 99, 80, 60,  60,  70,  70,  80,  80]) # power (SPU)
-    testing_profile = interp1d([  0,  10, 70, 100, 115, 125, 150, 180, 200], # times (s)
-                               [100, 100, 50,  50,   65,  65,  50,  80,  80]) # power (SPU)
-    lowpower_profile = interp1d([  0,   5, 100, 200], # times (s)
-                                [100, 100,  30,  90]) # power (SPU)
-    longtest_profile = interp1d([  0,  2000, 3000, 5500, 6000, 10000, 10020, 12500, 14000, 16000, 16010, 20000], # times (s)
-                                [100,   100,   90,   90,   45,    45,    65,    65,    80,    80,  95,  95]) # power (SPU)
+    # power profiles as (times, powers) breakpoints, interpolated by the envs
+    training_profile = (np.array([  0,  10, 20, 30, 50, 70, 120, 140, 160, 195, 200]),  # times (s)
+                        np.array([100, 100, 98, 99, 80, 60,  60,  70,  70,  80,  80]))  # power (SPU)
+    testing_profile = (np.array([  0,  10, 70, 100, 115, 125, 150, 180, 200]),  # times (s)
+                       np.array([100, 100, 50,  50,   65,  65,  50,  80,  80]))  # power (SPU)
+    lowpower_profile = (np.array([  0,   5, 100, 200]),  # times (s)
+                        np.array([100, 100,  30,  90]))  # power (SPU)
+    longtest_profile = (np.array([  0,  2000, 3000, 5500, 6000, 10000, 10020, 12500, 14000, 16000, 16010, 20000]),  # times (s)
+                        np.array([100,   100,   90,   90,   45,    45,    65,    65,    80,    80,  95,  95]))  # power (SPU)
 
     match args.test_profile:
         case 'longtest':
@@ -54,7 +61,8 @@ def main(args):
         print('Training Single Action RL...')
         training_kwargs['run_path'] = single_folder
         microutils.train_rl(envs.HolosSingle, training_kwargs,
-                            total_timesteps=args.timesteps, n_envs=args.n_envs)
+                            total_timesteps=args.timesteps, n_envs=args.n_envs,
+                            vec_env_type=args.vec_env)
 
     ##########################
     # Multi Drum RL Training #
@@ -66,7 +74,8 @@ def main(args):
         print('Training Multi Action RL...')
         training_kwargs['run_path'] = multi_folder
         microutils.train_rl(envs.HolosMulti, training_kwargs,
-                            total_timesteps=args.timesteps, n_envs=args.n_envs)
+                            total_timesteps=args.timesteps, n_envs=args.n_envs,
+                            vec_env_type=args.vec_env)
 
     ######################################
     # Multi Drum RL (symmetric) Training #
@@ -77,10 +86,16 @@ def main(args):
     if not model_folder.exists():  # if a model has already been trained, don't re-train
         print('Training Multi Action RL (Symmetric)...')
         training_kwargs['run_path'] = symmetric_folder
+        # same spaces as the multi action agent, only the reward differs, so its weights can be a starting point
+        # (off by default, a warm started training curve is not comparable to the others in graph 4)
+        multi_best_path = multi_folder / 'models' / 'best_model.zip'
+        warm_start = args.warm_start_symmetric and multi_best_path.exists()
         microutils.train_rl(envs.HolosMulti,
                             {**training_kwargs,
                              'symmetry_reward': True},
-                            total_timesteps=args.timesteps, n_envs=args.n_envs)
+                            total_timesteps=args.timesteps, n_envs=args.n_envs,
+                            vec_env_type=args.vec_env,
+                            warm_start_model_path=multi_best_path if warm_start else None)
 
     #################
     # MARL Training #
@@ -144,7 +159,6 @@ def main(args):
     # Graph 1: PID vs single-RL on test profile with temperature included
     # ###################################################################
     graph_1_path = graph_path / f'1-singletemp-{args.test_profile}.png'
-    plt.clf()
     fig, axs = plt.subplots(5, 1, sharex=True, figsize=(10, 12)) # power, error, temps, drum speed, drum position
     axs[0].plot(pid_test_history['time'], pid_test_history['desired_power'], label='Desired power', color='black', linestyle='-')
     axs[0].plot(pid_test_history['time'], pid_test_history['actual_power'], label='PID power', linestyle=':')
@@ -171,12 +185,11 @@ def main(args):
     axs[4].set_xlabel('Time (s)')
     axs[4].set_ylabel('Drum position (degrees)')
     fig.tight_layout()
-    fig.savefig(graph_1_path)
+    save_figure(fig, graph_1_path)
 
     # Graph 2: PID vs single-RL on test profile without temperature or drum position
     # ##############################################################################
     graph_2_path = graph_path / f'2-singlespeed-{args.test_profile}.png'
-    plt.clf()
     fig, axs = plt.subplots(3, 1, sharex=True, figsize=(10, 7)) # power, error, drum speed
     axs[0].plot(pid_test_history['time'], pid_test_history['desired_power'], label='Desired power', color='black', linestyle='-')
     axs[0].plot(pid_test_history['time'], pid_test_history['actual_power'], label='PID power', linestyle=':')
@@ -194,12 +207,11 @@ def main(args):
     axs[2].set_xlabel('Time (s)')
     axs[2].set_ylabel('Drum speed (degrees per second)')
     fig.tight_layout()
-    fig.savefig(graph_2_path)
+    save_figure(fig, graph_2_path)
 
     # Graph 3: PID vs single-RL on test profile with drum position
     # ############################################################
     graph_3_path = graph_path / f'3-singleposition-{args.test_profile}.png'
-    plt.clf()
     fig, axs = plt.subplots(4, 1, sharex=True, figsize=(10, 9)) # power, error, xenon + iodine, drum position
     axs[0].plot(pid_test_history['time'], pid_test_history['desired_power'], label='Desired power', color='black', linestyle='-')
     axs[0].plot(pid_test_history['time'], pid_test_history['actual_power'], label='PID power', linestyle=':')
@@ -223,7 +235,7 @@ def main(args):
     axs[3].set_xlabel('Time (s)')
     axs[3].set_ylabel('Drum position (degrees)')
     fig.tight_layout()
-    fig.savefig(graph_3_path)
+    save_figure(fig, graph_3_path)
 
     # Graph 4: training curves (ep len and rew) multi-rl vs symmetric-rl vs marl
     # ##################################################################
@@ -251,12 +263,11 @@ def main(args):
     axs[1].set_xlabel('Environment timesteps')
     axs[1].set_ylabel('Episode reward')
     axs[1].legend()
-    plt.savefig(graph_path / f'4_training-curves.png')
+    save_figure(fig, graph_path / f'4_training-curves.png')
 
     # Graph 5: multi-action vs symmetric vs marl
     # ##########################################
     graph_5_path = graph_path / f'5-multicompare-{args.test_profile}.png'
-    plt.clf()
     fig, axs = plt.subplots(4, 1, sharex=True, figsize=(10, 10)) # power, error
     axs[0].plot(multi_test_history['time'], multi_test_history['desired_power'], label='Desired power', color='black', linestyle='-')
     axs[0].plot(multi_test_history['time'], multi_test_history['actual_power'], label='Multi-RL power', linestyle='-.')
@@ -292,14 +303,13 @@ def main(args):
     axs[3].set_ylabel('Drum position (degrees)')
     axs[3].set_xlabel('Time (s)')
     fig.tight_layout()
-    fig.savefig(graph_5_path)
+    save_figure(fig, graph_5_path)
 
     # Graph 6: multi-action vs symmetric vs marl with Xenon and Iodine
     # ################################################################
     graph_6_path = graph_path / f'6-multicompare-{args.test_profile}.png'
     if args.disabled_drums > 0:
         graph_6_path = graph_path / f'6-multicompare-{args.test_profile}-d-{args.disabled_drums}.png'
-    plt.clf()
     fig, axs = plt.subplots(5, 1, sharex=True, figsize=(10, 12)) # power, error
     axs[0].plot(multi_test_history['time'], multi_test_history['desired_power'], label='Desired power', color='black', linestyle='-')
     axs[0].plot(multi_test_history['time'], multi_test_history['actual_power'], label='Multi-RL power', linestyle='-.')
@@ -345,7 +355,7 @@ def main(args):
     axs[4].set_ylabel('Concentration (m^-3)')
     axs[4].set_xlabel('Time (s)')
     fig.tight_layout()
-    fig.savefig(graph_6_path)
+    save_figure(fig, graph_6_path)
 
     # Graph 7: run histories for pid, single-rl, and marl at 0.015 noise
     # ##################################################################
@@ -368,7 +378,7 @@ def main(args):
         axs.set_ylabel('Power (SPU)')
         axs.legend()
         plt.legend()
-        plt.savefig(graph_path / f'7_noise-run-histories.png')
+        save_figure(fig, graph_path / f'7_noise-run-histories.png')
 
     # Graph 8: cae and ce vs noise level for pid, single-rl, and marl
     # ###############################################################
@@ -435,7 +445,7 @@ def main(args):
     axs[1].set_xlabel('Noise standard deviation (SPU)')
     axs[1].set_ylabel('Control Effort (degrees)')
     plt.legend()
-    plt.savefig(graph_path / f'8_noise-metrics.png')
+    save_figure(fig, graph_path / f'8_noise-metrics.png')
 
 
 if __name__ == '__main__':
@@ -448,5 +458,9 @@ if __name__ == '__main__':
                         help='Number of drums to disable during testing')
     parser.add_argument('-n', '--n_envs', type=int, default=10,
                         help='Number of environments to use for training')
+    parser.add_argument('--vec_env', type=str, choices=['dummy', 'subproc', 'batched'], default=None,
+                        help='Vectorized environment type for training (defaults to subproc when n_envs >= 4)')
+    parser.add_argument('--warm_start_symmetric', action='store_true',
+                        help='Start symmetric RL training from the multi action RL model (its training curve in graph 4 then starts converged)')
     args = parser.parse_args()
     main(args)
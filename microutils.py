@@ -1,19 +1,54 @@
-import os
+import copy
 from pathlib import Path
 import numpy as np
 import pandas as pd
-from scipy.optimize import minimize, differential_evolution
-from scipy.interpolate import interp1d
+from numba import njit
+from scipy.optimize import differential_evolution
+import torch
 import stable_baselines3 as sb3
 from stable_baselines3.common.env_util import make_vec_env
-from stable_baselines3.common.callbacks import EvalCallback, CheckpointCallback
-from stable_baselines3.common.vec_env import VecMonitor
-from stable_baselines3.common.monitor import Monitor
+from stable_baselines3.common.callbacks import BaseCallback, EvalCallback, CheckpointCallback
+from stable_baselines3.common.vec_env import VecMonitor, VecNormalize, DummyVecEnv, SubprocVecEnv
 import supersuit as ss
-from pettingzoo.utils.conversions import parallel_to_aec
 
 import envs
 
+# the policies are small MLPs, so multithreaded BLAS only adds contention with env stepping
+torch.set_num_threads(1)
+torch.set_num_interop_threads(1)
+
+
+@njit(cache=True)
+def _pid_step(Kp, Ki, Kd, max_rate, integral, err_prev, err):
+    """
+    Compiled PID arithmetic for a 1 second timestep.
+    Returns:
+        the saturated command, new integral, new previous error, and derivative
+    """
+    integral += Ki * err
+    deriv = err - err_prev
+    command = Kp * err + integral + Kd * deriv
+    command_sat = min(max(command, -max_rate), max_rate)
+    return command_sat, integral, err, deriv
+
+
+@njit(cache=True)
+def _pd_step(Kp, Kd, max_rate, err_prev, err):
+    """
+    _pid_step specialized for Ki == 0, where the integral term is always zero.
+    Returns:
+        the saturated command, new previous error, and derivative
+    """
+    deriv = err - err_prev
+    command = Kp * err + Kd * deriv
+    command_sat = min(max(command, -max_rate), max_rate)
+    return command_sat, err, deriv
+
+
+# compile at import rather than inside a tuning run
+_pid_step(0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0)
+_pd_step(0.0, 0.0, 1.0, 0.0, 0.0)
+
 
 class PIDController:
     """
@@ -25,14 +60,16 @@ class PIDController:
         max_rate: the maximum rate of change of the control signal
     """
     def __init__(self, Kp=.071, Ki=0, Kd=0.34, max_rate=1):
-        self.Kp = Kp
-        self.Ki = Ki
-        self.Kd = Kd
-        self.max_rate = max_rate
+        self.Kp = float(Kp)
+        self.Ki = float(Ki)
+        self.Kd = float(Kd)
+        self.max_rate = float(max_rate)
         self.integral = 0.0
         self.err_prev = 0.0
         self.t_prev = 0.0
         self.deriv_prev = 0.0
+        if self.Ki == 0:  # the integral term stays at zero, so skip it entirely
+            self.update = self._update_pd
 
     def update(self, measurement, setpoint):
         """
@@ -40,132 +77,233 @@ class PIDController:
         Returns:
             the new control signal
         """
-        err = setpoint - measurement
-        del_t = 1
-        self.integral += self.Ki * err * del_t
-        self.deriv_prev = (err - self.err_prev) / (del_t)
-        self.err_prev = err
-        command = self.Kp * err + self.integral + self.Kd * self.deriv_prev
-        command_sat = np.clip([command], -self.max_rate, self.max_rate)  # array
-        return command_sat
+        err = float(setpoint - measurement)
+        command_sat, self.integral, self.err_prev, self.deriv_prev = _pid_step(
+            self.Kp, self.Ki, self.Kd, self.max_rate, self.integral, self.err_prev, err)
+        return np.array([command_sat], dtype=np.float32)
+
+    def _update_pd(self, measurement, setpoint):
+        """update() specialized for a PD controller (Ki == 0)"""
+        err = float(setpoint - measurement)
+        command_sat, self.err_prev, self.deriv_prev = _pd_step(
+            self.Kp, self.Kd, self.max_rate, self.err_prev, err)
+        return np.array([command_sat], dtype=np.float32)
 
 
 def pid_loop(single_env):
     controller = PIDController()
     obs, _ = single_env.reset()
+    desired = single_env.desired_profile
     done = False
     while not done:
-        action = controller.update(obs["power"]*100,
-                                   single_env.profile(single_env.time+1))
+        action = controller.update(obs["power"].item()*100,
+                                   desired[single_env.time+1])
         obs, _, terminated, truncated, _ = single_env.step(action)
         if terminated or truncated:
             done = True
-    single_env.render()
+    return single_env.render()
 
 
 def test_pid(env_type: type, env_kwargs: dict) -> pd.DataFrame:
     run_folder = env_kwargs['run_path']
     test_env = env_type(**env_kwargs)
-    pid_loop(test_env)
-    history_path = find_latest_file(run_folder, pattern='run_history*.csv')
-    history = load_history(history_path)
+    history = pid_loop(test_env)
     mae, cae, control_effort, mean_control_effort = calc_metrics(history)
     print(f'{run_folder.name} - MAE: {mae}, CAE: {cae}, Control Effort: {control_effort}, Mean Control Effort: {mean_control_effort}')
     return history
 
 
+def pid_objective(params, profile, episode_length):
+    """Cumulative absolute error of a PID controller with the given gains over one episode"""
+    p_gain, i_gain, d_gain = params
+    holos_env = envs.HolosSingle(profile=profile, episode_length=episode_length, train_mode=False)
+    desired = holos_env.desired_profile
+    controller = PIDController(p_gain, i_gain, d_gain)
+    obs, info = holos_env.reset()
+    powers = np.empty((episode_length, 2))  # desired and actual power at each timestep
+    powers[0] = info['latest'][10:12]  # 10 and 11 are the desired and actual power indices
+    done = False
+    while not done:
+        measured_power = obs["power"].item() * 100
+        action = controller.update(measured_power, desired[holos_env.time+1])
+        obs, _, terminated, truncated, info = holos_env.step(action)
+        powers[holos_env.time] = info['latest'][10:12]
+        if terminated or truncated:
+            done = True
+        if obs['power'] > 1.2:
+            fake_iae = 1_000 * obs['power'].item()
+            print(f'IAE: {fake_iae}, gains: {p_gain}, {i_gain}, {d_gain}')
+            return fake_iae
+    powers = powers[:holos_env.time+1]
+    cae = 100 * np.sum(np.abs(powers[:, 0] - powers[:, 1]))
+    print(f'CAE: {cae}, gains: {p_gain}, {i_gain}, {d_gain}')
+    return cae
+
+
 def tune_pid(profile, episode_length=200):
-    run_folder = Path.cwd() / 'runs' / 'pid_train'
-    run_folder.mkdir(exist_ok=True, parents=True)
-    holos_env = envs.HolosSingle(profile=profile, episode_length=episode_length, run_path=run_folder, train_mode=False)
-
-    def pid_objective(params):
-        p_gain, i_gain, d_gain = params
-        controller = PIDController(p_gain, i_gain, d_gain)
-        obs, _ = holos_env.reset()
-        done = False
-        while not done:
-            action = controller.update(obs["power"]*100,
-                                       holos_env.profile(holos_env.time+1))
-            obs, _, terminated, truncated, _ = holos_env.step(action)
-            if terminated or truncated:
-                done = True
-            if obs['power'] > 1.2:
-                fake_iae = 1_000 * obs['power'].item()
-                print(f'IAE: {fake_iae}, gains: {p_gain}, {i_gain}, {d_gain}')
-                return fake_iae
-        holos_env.render()
-        _, cae, _, _ = calc_metrics(holos_env.multi_env.history)
-        print(f'CAE: {cae}, gains: {p_gain}, {i_gain}, {d_gain}')
-        return cae
-    
-    # return differential_evolution(pid_objective, [(0, 1), (0, 1), (0, 1)])
-    return minimize(pid_objective, [0.08, 0, 0.3], bounds=[(0, 5), (0, 5), (0, 5)], method='SLSQP')
+    # each candidate is an independent episode, so evaluate a generation across all cores
+    return differential_evolution(pid_objective, [(0, 0.3), (0, 0.01), (0, 0.6)],
+                                  args=(profile, episode_length), x0=[0.08, 0, 0.3],
+                                  workers=-1, updating='deferred', polish=True,
+                                  maxiter=30, tol=1e-4)
 
 
 def find_latest_file(folder_path: Path, pattern: str='*') -> Path:
     assert folder_path.exists()
-    assert any(folder_path.glob(pattern)), f"No files match pattern '{pattern}' in folder '{folder_path}'"
-    latest_file = sorted(folder_path.glob(pattern), key=os.path.getmtime, reverse=True)[0]
+    latest_file = max(folder_path.glob(pattern), key=lambda path: path.stat().st_mtime, default=None)
+    assert latest_file is not None, f"No files match pattern '{pattern}' in folder '{folder_path}'"
     assert latest_file.is_file(), f"Latest file '{latest_file}' is not a file"
     return latest_file
 
 
-def load_history(history_path: Path):
-    assert history_path.exists()
-    history = pd.read_csv(history_path)
-    assert history['desired_power'][0] == 1, 'steady state initial power value should be 100'
-    assert history['drum_8'][0] == 77.8, 'steady state initial drum angle should be 77.8'
-    return history
-
-
 def calc_metrics(history: pd.DataFrame):
     assert history['time'][1] - history['time'][0] == 1, 'metric calculations assume 1 second timesteps'
-    error = history['desired_power'] - history['actual_power']
-    absolute_error = np.abs(error)
-    mean_absolute_error = 100 * np.mean(absolute_error)
-    cumulative_absolute_error = 100 * np.sum(absolute_error)
-    drum_angles = history[['drum_1', 'drum_2', 'drum_3', 'drum_4', 'drum_5', 'drum_6', 'drum_7', 'drum_8']]
-    drum_speeds = np.diff(drum_angles, axis=0)
-    absolute_drum_speeds = np.abs(drum_speeds)
-    control_effort = np.sum(absolute_drum_speeds)
+    absolute_error = history['desired_power'].to_numpy() - history['actual_power'].to_numpy()
+    np.abs(absolute_error, out=absolute_error)
+    mean_absolute_error = 100 * absolute_error.mean()
+    cumulative_absolute_error = 100 * absolute_error.sum()
+    drum_angles = history[['drum_1', 'drum_2', 'drum_3', 'drum_4', 'drum_5', 'drum_6', 'drum_7', 'drum_8']].to_numpy(copy=False)
+    control_effort = np.abs(np.diff(drum_angles, axis=0)).sum()
     mean_control_effort = control_effort / len(history)
     return mean_absolute_error, cumulative_absolute_error, control_effort, mean_control_effort
 
 
-def train_rl(env_type, env_kwargs, total_timesteps=2_000_000, n_envs=10):
+def select_device(effective_batch, min_gpu_batch=4096):
+    """Run PPO updates on the GPU once each rollout is large enough to benefit"""
+    return 'cuda' if torch.cuda.is_available() and effective_batch >= min_gpu_batch else 'cpu'
+
+
+class SaveVecNormalizeCallback(BaseCallback):
+    """Saves the VecNormalize statistics, e.g. alongside each new best model"""
+    def __init__(self, save_path: Path):
+        super().__init__()
+        self.save_path = save_path
+
+    def _on_step(self) -> bool:
+        self.model.get_vec_normalize_env().save(str(self.save_path))
+        return True
+
+
+class InMemoryTopKCallback(CheckpointCallback):
+    """
+    A checkpoint callback that keeps the k best policies (by mean training episode
+    reward) in memory instead of serializing every checkpoint. The current best is
+    written to disk as training goes, and all k are written when training ends
+    so the caller can pick between them, e.g. on deterministic test error.
+    Attributes:
+        k: the number of policies to keep in memory
+        top_k: (mean episode reward, policy update count, policy state dict) tuples, best first
+    """
+    def __init__(self, save_freq: int, save_path: str, name_prefix: str = 'best_model', k: int = 3, verbose: int = 0):
+        super().__init__(save_freq=save_freq, save_path=save_path, name_prefix=name_prefix, verbose=verbose)
+        self.k = k
+        self.top_k = []
+
+    def _on_step(self) -> bool:
+        if self.n_calls % self.save_freq != 0 or len(self.model.ep_info_buffer) == 0:
+            return True
+        # the policy only changes after each rollout, so checkpoints within one rollout have the same weights
+        n_updates = self.model._n_updates
+        if any(kept_updates == n_updates for _, kept_updates, _ in self.top_k):
+            return True
+        mean_reward = np.mean([ep_info['r'] for ep_info in self.model.ep_info_buffer])
+        if len(self.top_k) == self.k and mean_reward <= self.top_k[-1][0]:
+            return True
+        entry = (mean_reward, n_updates, copy.deepcopy(self.model.policy.state_dict()))
+        self.top_k.append(entry)
+        self.top_k.sort(key=lambda kept: kept[0], reverse=True)
+        del self.top_k[self.k:]
+        if self.top_k[0] is entry:  # the current policy is the new best
+            model_path = Path(self.save_path) / f'{self.name_prefix}.zip'
+            self.model.save(model_path)
+            if self.verbose >= 1:
+                print(f'Saving new best model with mean reward {mean_reward:.2f} to {model_path}')
+        return True
+
+    def _on_training_end(self) -> None:
+        if len(self.top_k) == 0:
+            return
+        final_state = copy.deepcopy(self.model.policy.state_dict())
+        for i, (mean_reward, _, state) in enumerate(self.top_k):
+            self.model.policy.load_state_dict(state)
+            model_path = Path(self.save_path) / f'{self.name_prefix}_{i}.zip'
+            self.model.save(model_path)
+            if self.verbose >= 1:
+                print(f'Saving model {i} with mean reward {mean_reward:.2f} to {model_path}')
+        self.model.policy.load_state_dict(final_state)
+        # the running best is now one of the numbered models
+        (Path(self.save_path) / f'{self.name_prefix}.zip').unlink(missing_ok=True)
+
+
+def train_rl(env_type, env_kwargs, total_timesteps=2_000_000, n_envs=10, vec_env_type=None,
+             warm_start_model_path=None):
     run_folder = env_kwargs['run_path']
     model_folder = run_folder / 'models/'
     model_folder.mkdir(exist_ok=True)
     log_dir = run_folder / 'logs/'
-    vec_env = make_vec_env(env_type, n_envs=n_envs,
-                            env_kwargs=env_kwargs)
+    if vec_env_type is None:  # stepping the reactor dominates, so use subprocesses once there are enough envs
+        vec_env_type = 'subproc' if n_envs >= 4 else 'dummy'
+    if vec_env_type == 'batched':  # all envs advanced together by one compiled kernel
+        vec_env = envs.BatchedHolosVecEnv(n_envs, single_action=(env_type is envs.HolosSingle),
+                                          **env_kwargs)
+    else:
+        vec_env_cls = SubprocVecEnv if vec_env_type == 'subproc' else DummyVecEnv
+        vec_env = make_vec_env(env_type, n_envs=n_envs,
+                                env_kwargs=env_kwargs,
+                                vec_env_cls=vec_env_cls)
     vec_env = VecMonitor(vec_env,
                         filename=str(log_dir / 'vec'))
-    model = sb3.PPO('MultiInputPolicy', vec_env, verbose=1,
-                    tensorboard_log=str(log_dir),
-                    device='cpu')
-    eval_env = env_type(**env_kwargs)
-    eval_env = Monitor(eval_env, filename=str(log_dir / 'eval'))
+    warm_start_stats_path = None
+    if warm_start_model_path is not None:
+        warm_start_stats_path = Path(warm_start_model_path).parent / 'vecnormalize.pkl'
+    if warm_start_stats_path is not None and warm_start_stats_path.exists():
+        # keep normalizing observations the way the warm start policy saw them
+        vec_env = VecNormalize.load(str(warm_start_stats_path), vec_env)
+    elif warm_start_model_path is not None:
+        # models trained before normalization was added saw raw observations and rewards
+        vec_env = VecNormalize(vec_env, norm_obs=False, norm_reward=False, clip_obs=10.)
+    else:
+        vec_env = VecNormalize(vec_env, norm_obs=True, norm_reward=True, clip_obs=10.)
+    # a 2048 step rollout per env is a multiple of 256 for any n_envs, so minibatches come out even
+    n_steps = 2048
+    device = select_device(n_envs * n_steps)
+    if warm_start_model_path is None:
+        model = sb3.PPO('MultiInputPolicy', vec_env, verbose=1,
+                        n_steps=n_steps, batch_size=256,
+                        policy_kwargs={'net_arch': [64, 64]},
+                        tensorboard_log=str(log_dir),
+                        device=device)
+    else:  # continue from an already trained policy with the same spaces, overriding its stored rollout sizes
+        model = sb3.PPO.load(warm_start_model_path, env=vec_env, device=device,
+                             n_steps=n_steps, batch_size=256,
+                             tensorboard_log=str(log_dir))
+    # wrapped the same way as the training env so its statistics can be synced before each evaluation
+    eval_env = VecMonitor(DummyVecEnv([lambda: env_type(**env_kwargs)]), filename=str(log_dir / 'eval'))
+    eval_env = VecNormalize(eval_env, training=False,
+                            norm_obs=vec_env.norm_obs, norm_reward=False, clip_obs=10.)
     eval_freq = 10_000 / n_envs
     eval_freq = round(eval_freq, -3)  # round to nearest 1000 to eval every ~10k steps
     eval_callback = EvalCallback(eval_env=eval_env,
                                     best_model_save_path=str(model_folder),
                                     log_path=str(log_dir),
                                     deterministic=True,
-                                    eval_freq=eval_freq)
+                                    eval_freq=eval_freq,
+                                    callback_on_new_best=SaveVecNormalizeCallback(
+                                        model_folder / 'vecnormalize.pkl'))
     model.learn(total_timesteps=total_timesteps, callback=eval_callback, progress_bar=True)
 
 
-def rl_control_loop(model, env):
+def rl_control_loop(model, env, vec_normalize=None):
     obs, _ = env.reset()
     done = False
     while not done:
+        if vec_normalize is not None:
+            obs = vec_normalize.normalize_obs(obs)
         action, _states = model.predict(obs, deterministic=True)
         obs, _, terminated, truncated, _ = env.step(action)
         if terminated or truncated:
             done = True
-    env.render()
+    return env.render()
 
 
 def test_trained_rl(env_type: type, env_kwargs: dict) -> pd.DataFrame:
@@ -174,15 +312,19 @@ def test_trained_rl(env_type: type, env_kwargs: dict) -> pd.DataFrame:
     model_path = find_latest_file(model_folder, pattern='*.zip')
     model = sb3.PPO.load(model_path, device='cpu')
     test_env = env_type(**env_kwargs)
-    rl_control_loop(model, test_env)
-    history_path = find_latest_file(run_folder, pattern='run_history*.csv')
-    history = load_history(history_path)
+    vec_normalize = None
+    vec_normalize_path = model_folder / 'vecnormalize.pkl'
+    if vec_normalize_path.exists():  # models trained before normalization was added have no statistics
+        vec_normalize = VecNormalize.load(str(vec_normalize_path), DummyVecEnv([lambda: test_env]))
+        vec_normalize.training = False
+        vec_normalize.norm_reward = False
+    history = rl_control_loop(model, test_env, vec_normalize)
     mae, cae, control_effort, mean_control_effort = calc_metrics(history)
     print(f'{run_folder.name} - MAE: {mae}, CAE: {cae}, Control Effort: {control_effort}, Mean Control Effort: {mean_control_effort}')
     return history
 
 
-def train_marl(env_type, env_kwargs, total_timesteps=40_000_000, n_envs=10):
+def train_marl(env_type, env_kwargs, total_timesteps=40_000_000, n_envs=10, k=3):
     run_folder = env_kwargs['run_path']
     model_folder = run_folder / 'models/'
     model_folder.mkdir(exist_ok=True)
@@ -194,26 +336,30 @@ def train_marl(env_type, env_kwargs, total_timesteps=40_000_000, n_envs=10):
     env = ss.concat_vec_envs_v1(env, n_envs, base_class="stable_baselines3")
     vec_log_folder = run_folder / 'logs/vec'
     env = VecMonitor(env, filename=str(vec_log_folder))
-    # the model will be saved every 6envs * 8drums * 20_000 = 960_000 timesteps
+    # the model will be checkpointed every 6envs * 8drums * 20_000 = 960_000 timesteps
     save_freq = 100_000 / (8 * n_envs)
-    save_freq = round(save_freq, -3) # round to nearest 1000 to get saves every ~100k timesteps
-    checkpoint_callback = CheckpointCallback(save_freq=save_freq, save_path=str(model_folder),
-                                             name_prefix='ppo_marl')
-    model = sb3.PPO("MultiInputPolicy", env, verbose=1, tensorboard_log=str(log_dir), device='cpu')
+    save_freq = round(save_freq, -3) # round to nearest 1000 to get checkpoints every ~100k timesteps
+    # only the top k checkpoints are kept (in memory), all written to disk when training ends
+    checkpoint_callback = InMemoryTopKCallback(save_freq=save_freq, save_path=str(model_folder),
+                                               name_prefix='best_model', k=k)
+    n_steps = 2048
+    model = sb3.PPO("MultiInputPolicy", env, n_steps=n_steps, verbose=1, tensorboard_log=str(log_dir),
+                    device=select_device(n_envs * 8 * n_steps))  # one rollout per drum agent
     model.learn(total_timesteps=total_timesteps, callback=checkpoint_callback, progress_bar=True)
 
 
 def marl_control_loop(model, env):
-    env = parallel_to_aec(env)
-    env.reset()
-    for agent in env.agent_iter():
-        obs, reward, terminated, truncated, info = env.last()
-        if terminated or truncated:
-            break
-        else:
-            action, _ = model.predict(obs, deterministic=True)
-            env.step(action)
-    env.render()
+    observations, _ = env.reset()
+    done = False
+    while not done:
+        # stack every agent's observation so all drums share one forward pass
+        stacked_obs = {key: np.stack([observations[agent][key] for agent in env.agents])
+                       for key in observations[env.agents[0]]}
+        actions, _ = model.predict(stacked_obs, deterministic=True)
+        observations, _, terminations, truncations, _ = env.step(dict(zip(env.agents, actions)))
+        if any(terminations.values()) or any(truncations.values()):
+            done = True
+    return env.render()
 
 def test_trained_marl(env_type, env_kwargs):
     run_folder = env_kwargs['run_path']
@@ -221,9 +367,7 @@ def test_trained_marl(env_type, env_kwargs):
     model_path = find_latest_file(model_folder, pattern='best*.zip')
     model = sb3.PPO.load(model_path, device='cpu')
     test_env = env_type(**env_kwargs)
-    marl_control_loop(model, test_env)
-    history_path = find_latest_file(run_folder, pattern='run_history*.csv')
-    history = load_history(history_path)
+    history = marl_control_loop(model, test_env)
     mae, cae, control_effort, mean_control_effort = calc_metrics(history)
     print(f'{run_folder.name} - MAE: {mae}, CAE: {cae}, Control Effort: {control_effort}, Mean Control Effort: {mean_control_effort}')
     return history
@@ -261,8 +405,8 @@ def noise_loop(env_type, env_kwargs, type='rl', noise_levels=np.linspace(0, .03,
 
 
 if __name__ == '__main__':
-    training_profile = interp1d([  0,  10, 20, 30, 50, 70, 120, 140, 160, 195, 200], # times (s)
-                                [100, 100, 98, 99, 80, 60,  60,  70,  70,  80,  80]) # power (SPU)
+    training_profile = (np.array([  0,  10, 20, 30, 50, 70, 120, 140, 160, 195, 200]),  # times (s)
+                        np.array([100, 100, 98, 99, 80, 60,  60,  70,  70,  80,  80]))  # power (SPU)
     result = tune_pid(training_profile)
     print('Tuned PID parameters:')
     print(f'P gain: {result.x[0]}, I gain: {result.x[1]}, D gain: {result.x[2]}')
\ No newline at end of file